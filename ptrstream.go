@@ -2,34 +2,234 @@ package main
 
 import (
 	"bufio"
+	"bytes"
+	"encoding/binary"
 	"encoding/json"
+	"errors"
 	"flag"
 	"fmt"
+	"math/rand"
 	"net"
 	"net/http"
+	"net/netip"
 	"os"
+	"os/signal"
 	"regexp"
+	"runtime/pprof"
 	"strconv"
 	"strings"
 	"sync"
 	"sync/atomic"
+	"syscall"
 	"time"
 
-	"github.com/acidvegas/golcg"
 	"github.com/miekg/dns"
 	"github.com/rivo/tview"
 )
 
 const defaultResolversURL = "https://raw.githubusercontent.com/trickest/resolvers/refs/heads/main/resolvers.txt"
 
+// LCG parameters (Numerical Recipes). The increment is odd and the multiplier
+// minus one is divisible by 4, so the generator has a full period of 2^32 and
+// visits every IPv4 address exactly once per round.
+const (
+	lcgMultiplier = 1664525
+	lcgIncrement  = 1013904223
+)
+
+// Special-purpose ranges that will never carry a public PTR record
+var reservedNetworks = []string{
+	"0.0.0.0/8",
+	"10.0.0.0/8",
+	"100.64.0.0/10",
+	"127.0.0.0/8",
+	"169.254.0.0/16",
+	"172.16.0.0/12",
+	"192.0.0.0/24",
+	"192.0.2.0/24",
+	"192.168.0.0/16",
+	"198.18.0.0/15",
+	"198.51.100.0/24",
+	"203.0.113.0/24",
+	"224.0.0.0/4",
+	"240.0.0.0/4",
+}
+
+type reservedRange struct {
+	network uint32
+	mask    uint32
+}
+
+const (
+	octetPublic = iota
+	octetReserved
+	octetPartial
+)
+
+var reservedRanges, reservedFirstOctet = buildReservedTable(reservedNetworks)
+
+// buildReservedTable classifies every first octet as public, fully reserved
+// or partially reserved, so most addresses are settled by one table lookup.
+func buildReservedTable(networks []string) ([]reservedRange, [256]uint8) {
+	var ranges []reservedRange
+	var table [256]uint8
+
+	for _, network := range networks {
+		prefix := netip.MustParsePrefix(network)
+		addr := prefix.Addr().As4()
+		bits := prefix.Bits()
+		r := reservedRange{
+			network: uint32(addr[0])<<24 | uint32(addr[1])<<16 | uint32(addr[2])<<8 | uint32(addr[3]),
+			mask:    ^uint32(0) << (32 - bits),
+		}
+		ranges = append(ranges, r)
+
+		if bits <= 8 {
+			for i := 0; i < 1<<(8-bits); i++ {
+				table[int(addr[0])+i] = octetReserved
+			}
+		} else if table[addr[0]] == octetPublic {
+			table[addr[0]] = octetPartial
+		}
+	}
+
+	return ranges, table
+}
+
+func isReserved(ip uint32) bool {
+	switch reservedFirstOctet[ip>>24] {
+	case octetPublic:
+		return false
+	case octetReserved:
+		return true
+	}
+	for _, r := range reservedRanges {
+		if ip&r.mask == r.network {
+			return true
+		}
+	}
+	return false
+}
+
+// publicAddressCount is the number of addresses left once the reserved
+// ranges (which do not overlap) are taken out of the IPv4 space.
+func publicAddressCount() uint64 {
+	count := uint64(1 << 32)
+	for _, r := range reservedRanges {
+		count -= uint64(^r.mask) + 1
+	}
+	return count
+}
+
+type IPGenerator struct {
+	state uint32
+	index uint64
+	end   uint64
+}
+
+// newIPGenerator positions the generator at the start of this shard's slice
+// of the sequence. Shards own contiguous, equal-sized index ranges, so they
+// never overlap and each one only steps through its own part.
+func newIPGenerator(seed int64, shardNum, totalShards int) *IPGenerator {
+	start := (uint64(shardNum-1) << 32) / uint64(totalShards)
+	return &IPGenerator{
+		state: lcgSkip(uint32(seed), start),
+		index: start,
+		end:   (uint64(shardNum) << 32) / uint64(totalShards),
+	}
+}
+
+// lcgSkip advances the LCG state x by n steps in O(log n).
+func lcgSkip(x uint32, n uint64) uint32 {
+	accMul, accAdd := uint32(1), uint32(0)
+	curMul, curAdd := uint32(lcgMultiplier), uint32(lcgIncrement)
+	for n > 0 {
+		if n&1 == 1 {
+			accMul *= curMul
+			accAdd = accAdd*curMul + curAdd
+		}
+		curAdd = (curMul + 1) * curAdd
+		curMul *= curMul
+		n >>= 1
+	}
+	return accMul*x + accAdd
+}
+
+// mixIP scrambles an LCG state into an address. The low bits of a
+// power-of-two LCG cycle with short periods, so the raw state would keep
+// every shard on a fixed pattern of trailing bits. Each step here (xorshift
+// and odd multiply) is invertible, so distinct states still give distinct
+// addresses.
+func mixIP(x uint32) uint32 {
+	x ^= x >> 16
+	x *= 0x85ebca6b
+	x ^= x >> 13
+	x *= 0xc2b2ae35
+	x ^= x >> 16
+	return x
+}
+
+// next returns the next public address belonging to this shard, or false
+// once the shard's range of the sequence has been walked.
+func (g *IPGenerator) next() (uint32, bool) {
+	for g.index < g.end {
+		g.state = g.state*lcgMultiplier + lcgIncrement
+		g.index++
+		if ip := mixIP(g.state); !isReserved(ip) {
+			return ip, true
+		}
+	}
+	return 0, false
+}
+
+// feedIPs pushes this shard's addresses onto jobs, restarting the walk when
+// loop is set, and closes jobs once it is done or quit is closed.
+func feedIPs(jobs chan<- uint32, quit <-chan struct{}, seed int64, shardNum, totalShards int, loop bool) {
+	defer close(jobs)
+	for {
+		gen := newIPGenerator(seed, shardNum, totalShards)
+		for ip, ok := gen.next(); ok; ip, ok = gen.next() {
+			select {
+			case jobs <- ip:
+			case <-quit:
+				return
+			}
+		}
+
+		if !loop {
+			return
+		}
+	}
+}
+
+// Decimal text of every possible octet, so formatting an address is four
+// table lookups and a single concatenation.
+var octetStrings = buildOctetStrings()
+
+func buildOctetStrings() [256]string {
+	var octets [256]string
+	for i := range octets {
+		octets[i] = strconv.Itoa(i)
+	}
+	return octets
+}
+
+func formatIP(ip uint32) string {
+	return octetStrings[ip>>24] + "." + octetStrings[ip>>16&0xff] + "." + octetStrings[ip>>8&0xff] + "." + octetStrings[ip&0xff]
+}
+
 type Config struct {
 	concurrency   int
 	timeout       time.Duration
 	retries       int
 	dnsServers    []string
-	serverIndex   int
+	resolvers     []*Resolver
 	debug         bool
+	transport     *Transport
 	outputFile    *os.File
+	output        chan []byte
+	outputQuit    chan struct{}
+	outputDone    chan struct{}
 	mu            sync.Mutex
 	lastDNSUpdate time.Time
 	updateMu      sync.Mutex
@@ -66,21 +266,194 @@ func (s *Stats) incrementCNAME() {
 	atomic.AddUint64(&s.cnames, 1)
 }
 
-func (c *Config) getNextServer() string {
+const (
+	outputBufferSize    = 1 << 16
+	outputFlushRecords  = 1000
+	outputFlushInterval = 5 * time.Second
+)
+
+// startWriter hands the output file to a dedicated goroutine that batches
+// NDJSON records into large writes, so workers never block on disk I/O.
+func (c *Config) startWriter(f *os.File) {
+	c.outputFile = f
+	c.output = make(chan []byte, c.concurrency*2)
+	c.outputQuit = make(chan struct{})
+	c.outputDone = make(chan struct{})
+
+	go func() {
+		defer close(c.outputDone)
+
+		w := bufio.NewWriterSize(f, outputBufferSize)
+		ticker := time.NewTicker(outputFlushInterval)
+		defer ticker.Stop()
+
+		pending := 0
+		for {
+			select {
+			case line := <-c.output:
+				w.Write(line)
+				pending++
+				if pending >= outputFlushRecords {
+					w.Flush()
+					pending = 0
+				}
+			case <-ticker.C:
+				if pending > 0 {
+					w.Flush()
+					pending = 0
+				}
+			case <-c.outputQuit:
+				for {
+					select {
+					case line := <-c.output:
+						w.Write(line)
+					default:
+						w.Flush()
+						return
+					}
+				}
+			}
+		}
+	}()
+}
+
+// stopWriter flushes any queued records and closes the output file. Workers
+// still running afterwards simply block, as the process is about to exit.
+func (c *Config) stopWriter() {
+	if c.output == nil {
+		return
+	}
+	close(c.outputQuit)
+	<-c.outputDone
+	c.outputFile.Close()
+}
+
+const (
+	rttSmoothing        = 0.1
+	maxResolverFailures = 10
+	resolverCooldown    = time.Minute
+)
+
+// Resolver tracks a nameserver's smoothed response time and its run of
+// consecutive failures, which together decide how often it gets picked.
+type Resolver struct {
+	name         string
+	addr         netip.AddrPort
+	rtt          int64 // EWMA in nanoseconds
+	fails        uint32
+	benchedUntil int64 // unix nanoseconds, zero while in rotation
+}
+
+func (r *Resolver) score() float64 {
+	rtt := float64(atomic.LoadInt64(&r.rtt))
+	return rtt * float64(1+atomic.LoadUint32(&r.fails))
+}
+
+// available reports whether r may be picked at now. A resolver whose cooldown
+// has run out is re-admitted with a clean score so it gets probed again.
+func (r *Resolver) available(now time.Time) bool {
+	until := atomic.LoadInt64(&r.benchedUntil)
+	if until == 0 {
+		return true
+	}
+	if now.UnixNano() < until {
+		return false
+	}
+	if atomic.CompareAndSwapInt64(&r.benchedUntil, until, 0) {
+		atomic.StoreUint32(&r.fails, 0)
+		atomic.StoreInt64(&r.rtt, 0)
+	}
+	return true
+}
+
+// newResolvers builds the resolver pool, looking up hostname entries once
+// here so the hot path only ever deals with addresses.
+func newResolvers(servers []string) []*Resolver {
+	resolvers := make([]*Resolver, 0, len(servers))
+	for _, server := range servers {
+		addr, err := netip.ParseAddrPort(server)
+		if err != nil {
+			udpAddr, rerr := net.ResolveUDPAddr("udp", server)
+			if rerr != nil {
+				fmt.Printf("Skipping DNS server %s: %v\n", server, rerr)
+				continue
+			}
+			addr = udpAddr.AddrPort()
+		}
+		addr = netip.AddrPortFrom(addr.Addr().Unmap(), addr.Port())
+		resolvers = append(resolvers, &Resolver{name: server, addr: addr})
+	}
+	return resolvers
+}
+
+// getNextServer picks two resolvers at random and returns the better scored
+// one. Fast servers attract most of the load while untried ones (scored zero)
+// still get probed, and no single server is hammered by every worker. A
+// retry passes the server it just used as avoid, which loses any tie.
+// Benched resolvers are skipped unless every draw comes up benched.
+func (c *Config) getNextServer(avoid *Resolver) *Resolver {
 	if err := c.updateDNSServers(); err != nil {
 		fmt.Printf("Failed to update DNS servers: %v\n", err)
 	}
 
 	c.mu.Lock()
-	defer c.mu.Unlock()
+	resolvers := c.resolvers
+	c.mu.Unlock()
+
+	if len(resolvers) == 0 {
+		return nil
+	}
 
-	if len(c.dnsServers) == 0 {
-		return ""
+	now := time.Now()
+	pick := func() *Resolver {
+		var r *Resolver
+		for i := 0; i < 4; i++ {
+			r = resolvers[rand.Intn(len(resolvers))]
+			if r.available(now) {
+				break
+			}
+		}
+		return r
 	}
 
-	server := c.dnsServers[c.serverIndex]
-	c.serverIndex = (c.serverIndex + 1) % len(c.dnsServers)
-	return server
+	a, b := pick(), pick()
+	if a == avoid {
+		return b
+	}
+	if b == avoid || b.score() < a.score() {
+		return b
+	}
+	return a
+}
+
+// observe folds an RTT sample into the resolver's moving average.
+func (r *Resolver) observe(rtt time.Duration) {
+	for {
+		old := atomic.LoadInt64(&r.rtt)
+		next := int64(rtt)
+		if old != 0 {
+			next = int64((1-rttSmoothing)*float64(old) + rttSmoothing*float64(rtt))
+		}
+		if atomic.CompareAndSwapInt64(&r.rtt, old, next) {
+			return
+		}
+	}
+}
+
+func (r *Resolver) recordSuccess(rtt time.Duration) {
+	atomic.StoreUint32(&r.fails, 0)
+	r.observe(rtt)
+}
+
+// recordFailure charges a timeout, write error or REFUSED to r as a
+// full-timeout RTT sample. After too many in a row the resolver is benched
+// for resolverCooldown and then re-admitted by available.
+func (c *Config) recordFailure(r *Resolver) {
+	r.observe(c.timeout)
+	if atomic.AddUint32(&r.fails, 1) < maxResolverFailures {
+		return
+	}
+	atomic.CompareAndSwapInt64(&r.benchedUntil, 0, time.Now().Add(resolverCooldown).UnixNano())
 }
 
 func fetchDefaultResolvers() ([]string, error) {
@@ -152,6 +525,182 @@ type DNSResponse struct {
 	TTL        uint32 // Add TTL field
 }
 
+var errQueryTimeout = errors.New("i/o timeout")
+
+// Queries are packed into pooled buffers; a PTR question always fits in the
+// classic 512 byte UDP limit.
+var packBufferPool = sync.Pool{
+	New: func() any {
+		buf := make([]byte, dns.MinMsgSize)
+		return &buf
+	},
+}
+
+// Wire-format labels for every possible octet plus the fixed in-addr.arpa
+// tail, so a reverse query name is four table lookups.
+var octetLabels = buildOctetLabels()
+
+const arpaSuffix = "\x07in-addr\x04arpa\x00"
+
+func buildOctetLabels() [256]string {
+	var labels [256]string
+	for i, s := range octetStrings {
+		labels[i] = string(rune(len(s))) + s
+	}
+	return labels
+}
+
+// appendQuery appends a recursive PTR query for ip's in-addr.arpa name to b.
+func appendQuery(b []byte, id uint16, ip uint32) []byte {
+	b = binary.BigEndian.AppendUint16(b, id)
+	b = append(b, 0x01, 0x00) // RD
+	b = append(b, 0, 1, 0, 0, 0, 0, 0, 0)
+	b = append(b, octetLabels[ip&0xff]...)
+	b = append(b, octetLabels[ip>>8&0xff]...)
+	b = append(b, octetLabels[ip>>16&0xff]...)
+	b = append(b, octetLabels[ip>>24]...)
+	b = append(b, arpaSuffix...)
+	b = binary.BigEndian.AppendUint16(b, dns.TypePTR)
+	return binary.BigEndian.AppendUint16(b, dns.ClassINET)
+}
+
+// Reply is what the read loop learned from a response header. The datagram
+// itself is only kept when it carries answers worth unpacking.
+type Reply struct {
+	rcode     int
+	truncated bool
+	data      []byte
+}
+
+type pendingQuery struct {
+	server netip.AddrPort
+	ip     uint32
+	reply  chan Reply
+}
+
+// Transport multiplexes every outstanding query over a single UDP socket and
+// matches responses back to their callers by message ID, so thousands of
+// lookups can be in flight without a socket being dialled for each one.
+type Transport struct {
+	conn    *net.UDPConn
+	mu      sync.Mutex
+	pending map[uint16]*pendingQuery
+}
+
+func newTransport() (*Transport, error) {
+	conn, err := net.ListenUDP("udp", nil)
+	if err != nil {
+		return nil, fmt.Errorf("failed to open UDP socket: %v", err)
+	}
+	conn.SetReadBuffer(1 << 22)
+	conn.SetWriteBuffer(1 << 22)
+
+	t := &Transport{
+		conn:    conn,
+		pending: make(map[uint16]*pendingQuery),
+	}
+	go t.readLoop()
+	return t, nil
+}
+
+func (t *Transport) readLoop() {
+	buf := make([]byte, 4096)
+	question := make([]byte, 0, dns.MinMsgSize)
+	for {
+		n, from, err := t.conn.ReadFromUDPAddrPort(buf)
+		if err != nil {
+			if errors.Is(err, net.ErrClosed) {
+				return
+			}
+			continue
+		}
+
+		// Drop anything too short to hold a header or without the QR bit set
+		if n < 12 || buf[2]&0x80 == 0 {
+			continue
+		}
+		id := binary.BigEndian.Uint16(buf[0:2])
+
+		// Only accept the answer from the server it was asked of, and only if
+		// it echoes the question, so a late reply can never be matched to a
+		// different address that has since reused the ID
+		from = netip.AddrPortFrom(from.Addr().Unmap(), from.Port())
+		t.mu.Lock()
+		p, ok := t.pending[id]
+		if ok && p.server == from && questionMatches(buf[:n], appendQuery(question[:0], id, p.ip)) {
+			delete(t.pending, id)
+		} else {
+			ok = false
+		}
+		t.mu.Unlock()
+
+		if !ok {
+			continue
+		}
+
+		r := Reply{rcode: int(buf[3] & 0x0f), truncated: buf[2]&0x02 != 0}
+		if r.rcode == dns.RcodeSuccess && !r.truncated && binary.BigEndian.Uint16(buf[6:8]) > 0 {
+			r.data = append([]byte(nil), buf[:n]...)
+		}
+		p.reply <- r
+	}
+}
+
+// questionMatches reports whether the response carries exactly the one
+// question that was sent in query.
+func questionMatches(response, query []byte) bool {
+	if len(response) < len(query) || binary.BigEndian.Uint16(response[4:6]) != 1 {
+		return false
+	}
+	return bytes.EqualFold(response[12:len(query)], query[12:])
+}
+
+func (t *Transport) forget(id uint16) {
+	t.mu.Lock()
+	delete(t.pending, id)
+	t.mu.Unlock()
+}
+
+// exchange sends a PTR query for ip to server and waits for the matching
+// reply.
+func (t *Transport) exchange(ip uint32, server netip.AddrPort, timeout time.Duration) (Reply, error) {
+	server = netip.AddrPortFrom(server.Addr().Unmap(), server.Port())
+	reply := make(chan Reply, 1)
+
+	// Start from a random ID and probe for a free one, giving up after a
+	// full pass rather than spinning when every ID is in flight
+	t.mu.Lock()
+	id := uint16(rand.Uint32())
+	for tries := 0; t.pending[id] != nil; tries++ {
+		if tries == 1<<16 {
+			t.mu.Unlock()
+			return Reply{}, errors.New("no free DNS message IDs")
+		}
+		id++
+	}
+	t.pending[id] = &pendingQuery{server: server, ip: ip, reply: reply}
+	t.mu.Unlock()
+
+	buf := packBufferPool.Get().(*[]byte)
+	_, err := t.conn.WriteToUDPAddrPort(appendQuery((*buf)[:0], id, ip), server)
+	packBufferPool.Put(buf)
+	if err != nil {
+		t.forget(id)
+		return Reply{}, err
+	}
+
+	timer := time.NewTimer(timeout)
+	defer timer.Stop()
+
+	select {
+	case r := <-reply:
+		return r, nil
+	case <-timer.C:
+		t.forget(id)
+		return Reply{}, errQueryTimeout
+	}
+}
+
 func translateRcode(rcode int) string {
 	switch rcode {
 	case dns.RcodeSuccess:
@@ -171,43 +720,66 @@ func translateRcode(rcode int) string {
 	}
 }
 
-func lookupWithRetry(ip string, cfg *Config) (DNSResponse, string, error) {
+func lookupWithRetry(ip uint32, cfg *Config) (DNSResponse, string, error) {
 	var lastErr error
 	var lastServer string
+	var previous, nxdomainFrom *Resolver
 
 	for i := 0; i < cfg.retries; i++ {
-		server := cfg.getNextServer()
-		if server == "" {
+		resolver := cfg.getNextServer(previous)
+		if resolver == nil {
 			return DNSResponse{}, "", fmt.Errorf("no DNS servers available")
 		}
+		previous = resolver
+		server := resolver.name
 		lastServer = server
 
-		// Create DNS message
-		m := new(dns.Msg)
-		arpa, err := dns.ReverseAddr(ip)
+		// Make the query
+		start := time.Now()
+		reply, err := cfg.transport.exchange(ip, resolver.addr, cfg.timeout)
 		if err != nil {
-			return DNSResponse{}, "", err
+			cfg.recordFailure(resolver)
+			lastErr = err
+			continue
 		}
-		m.SetQuestion(arpa, dns.TypePTR)
-		m.RecursionDesired = true
 
-		// Create DNS client
-		c := new(dns.Client)
-		c.Timeout = cfg.timeout
+		// SERVFAIL usually means a broken delegation rather than a broken
+		// resolver, so it only feeds the RTT average
+		switch reply.rcode {
+		case dns.RcodeRefused:
+			cfg.recordFailure(resolver)
+		case dns.RcodeServerFailure:
+			resolver.observe(time.Since(start))
+		default:
+			resolver.recordSuccess(time.Since(start))
+		}
 
-		// Make the query
-		r, _, err := c.Exchange(m, server)
-		if err != nil {
-			lastErr = err
+		// NXDOMAIN is final once a second resolver agrees, so a server that
+		// answers NXDOMAIN to everything cannot swallow the scan on its own
+		if reply.rcode == dns.RcodeNameError {
+			if nxdomainFrom != nil && nxdomainFrom != resolver {
+				return DNSResponse{}, server, fmt.Errorf("%s", translateRcode(reply.rcode))
+			}
+			nxdomainFrom = resolver
+		}
+
+		if reply.rcode != dns.RcodeSuccess {
+			lastErr = fmt.Errorf("%s", translateRcode(reply.rcode))
 			continue
 		}
 
-		if r.Rcode != dns.RcodeSuccess {
-			lastErr = fmt.Errorf("%s", translateRcode(r.Rcode))
+		if reply.truncated {
+			lastErr = fmt.Errorf("response truncated")
 			continue
 		}
 
 		// Process the response
+		r := new(dns.Msg)
+		if reply.data != nil && r.Unpack(reply.data) != nil {
+			lastErr = fmt.Errorf("Format error")
+			continue
+		}
+
 		if len(r.Answer) > 0 {
 			var names []string
 			var ttl uint32
@@ -260,51 +832,66 @@ func reverse(ss []string) []string {
 	return reversed
 }
 
-func colorizeIPInPtr(ptr, ip string) string {
-	specialHosts := []string{"localhost", "undefined.hostname.localhost", "unknown"}
-	for _, host := range specialHosts {
-		if strings.EqualFold(ptr, host) {
-			return "[gray]" + ptr
-		}
-	}
+var specialHosts = []string{"localhost", "undefined.hostname.localhost", "unknown"}
 
+// ipVariants returns the forms an address commonly takes inside a PTR name,
+// in the order they should win when two start at the same offset.
+func ipVariants(ip string) []string {
 	octets := strings.Split(ip, ".")
+	reversed := reverse(octets)
 
-	patterns := []string{
-		strings.ReplaceAll(ip, ".", "\\."),
-		strings.Join(reverse(strings.Split(ip, ".")), "\\."),
-		strings.ReplaceAll(ip, ".", "-"),
-		strings.Join(reverse(strings.Split(ip, ".")), "-"),
-	}
-
-	zeroPadded := make([]string, 4)
+	zeroPadded := make([]string, len(octets))
 	for i, octet := range octets {
-		zeroPadded[i] = fmt.Sprintf("%03d", parseInt(octet))
+		zeroPadded[i] = strings.Repeat("0", max(0, 3-len(octet))) + octet
 	}
-	patterns = append(patterns,
+
+	return []string{
+		ip,
+		strings.Join(reversed, "."),
+		strings.Join(octets, "-"),
+		strings.Join(reversed, "-"),
 		strings.Join(zeroPadded, "-"),
 		strings.Join(reverse(zeroPadded), "-"),
-	)
-
-	pattern := strings.Join(patterns, "|")
-	re := regexp.MustCompile("(" + pattern + ")")
+	}
+}
 
-	matches := re.FindAllStringIndex(ptr, -1)
-	if matches == nil {
-		return "[white]" + ptr
+func colorizeIPInPtr(ptr, ip string) string {
+	for _, host := range specialHosts {
+		if strings.EqualFold(ptr, host) {
+			return "[gray]" + ptr
+		}
 	}
 
+	variants := ipVariants(ip)
+
 	var result strings.Builder
 	lastEnd := 0
+	matched := false
 
-	for _, match := range matches {
-		if match[0] > lastEnd {
+	for lastEnd < len(ptr) {
+		start, length := -1, 0
+		for _, v := range variants {
+			if idx := strings.Index(ptr[lastEnd:], v); idx != -1 && (start == -1 || idx < start) {
+				start, length = idx, len(v)
+			}
+		}
+		if start == -1 {
+			break
+		}
+
+		start += lastEnd
+		if start > lastEnd {
 			result.WriteString("[white]")
-			result.WriteString(ptr[lastEnd:match[0]])
+			result.WriteString(ptr[lastEnd:start])
 		}
 		result.WriteString("[aqua]")
-		result.WriteString(ptr[match[0]:match[1]])
-		lastEnd = match[1]
+		result.WriteString(ptr[start : start+length])
+		lastEnd = start + length
+		matched = true
+	}
+
+	if !matched {
+		return "[white]" + ptr
 	}
 
 	if lastEnd < len(ptr) {
@@ -314,67 +901,148 @@ func colorizeIPInPtr(ptr, ip string) string {
 
 	finalResult := result.String()
 
-	if strings.HasSuffix(finalResult, ".in-addr.arpa") {
+	switch {
+	case strings.HasSuffix(finalResult, ".in-addr.arpa"):
 		finalResult = finalResult[:len(finalResult)-13] + ".[blue]in-addr.arpa"
-	}
-	if strings.HasSuffix(finalResult, ".gov") {
+	case strings.HasSuffix(finalResult, ".gov"):
 		finalResult = finalResult[:len(finalResult)-4] + ".[red]gov"
-	}
-	if strings.HasSuffix(finalResult, ".mil") {
+	case strings.HasSuffix(finalResult, ".mil"):
 		finalResult = finalResult[:len(finalResult)-4] + ".[red]mil"
 	}
 
 	return finalResult
 }
 
-func parseInt(s string) int {
-	num := 0
-	fmt.Sscanf(s, "%d", &num)
-	return num
+const maxBufferLines = 1000
+
+// Output is batched and pushed to the screen at most this often
+const displayFlushInterval = 100 * time.Millisecond
+
+// LineBuffer collects rendered lines from the workers so the results view is
+// updated in batches instead of being redrawn once per line.
+type LineBuffer struct {
+	mu  sync.Mutex
+	buf bytes.Buffer
+}
+
+func (l *LineBuffer) add(line string) {
+	l.mu.Lock()
+	l.buf.WriteString(line)
+	l.mu.Unlock()
 }
 
-const maxBufferLines = 1000
+// take returns everything buffered since the last call, or nil if empty.
+func (l *LineBuffer) take() []byte {
+	l.mu.Lock()
+	defer l.mu.Unlock()
+
+	if l.buf.Len() == 0 {
+		return nil
+	}
+	data := bytes.Clone(l.buf.Bytes())
+	l.buf.Reset()
+	return data
+}
+
+const timeFormat = "2006-01-02 15:04:05"
+
+// Line templates for the results view; the fixed-width padding and colour
+// tags are baked in so each line needs a single Sprintf.
+const (
+	errorLineFormat          = "[gray]%s [gray]│[-] [purple]%15s[-] [gray]│[-] [aqua]%-15s[-] [gray]│[-] [red] ERR [-] [gray]│[-] [gray]      [-] [gray]│[-] %s\n"
+	resultLineFormat         = "[gray]%s [gray]│[-] [purple]%15s[-] [gray]│[-] [aqua]%-15s[-] [gray]│[-] %s [gray]│[-] %s [gray]│[-] %s\n"
+	resultLineNoServerFormat = "[gray]%s [gray]│[-] [purple]%15s[-] [gray]│[-] %s [gray]│[-] %s [gray]│[-] %s\n"
+	ptrTag                   = "[blue] PTR [-]"
+	cnameTag                 = "[fuchsia]CNAME[-]"
+)
+
+const noPTRRecord = "FAIL.NO-PTR-RECORD.in-addr.arpa"
+
+// resolve looks ip up through the configured resolvers, or the system
+// resolver when there are none, and strips the port from the nameserver.
+func resolve(ip uint32, cfg *Config) (DNSResponse, string, error) {
+	if len(cfg.dnsServers) == 0 {
+		names, err := net.LookupAddr(formatIP(ip))
+		if err != nil {
+			return DNSResponse{}, "", err
+		}
+		return DNSResponse{Names: names, RecordType: "PTR"}, "", nil
+	}
+
+	response, server, err := lookupWithRetry(ip, cfg)
+	if idx := strings.Index(server, ":"); idx != -1 {
+		server = server[:idx]
+	}
+	return response, server, err
+}
 
-func worker(jobs <-chan string, wg *sync.WaitGroup, cfg *Config, stats *Stats, textView *tview.TextView, app *tview.Application) {
+// firstPTR returns the first non-empty name in names, lowercased and without
+// its trailing dot.
+func firstPTR(names []string) string {
+	for _, name := range names {
+		if cleaned := strings.TrimSpace(strings.TrimSuffix(name, ".")); cleaned != "" {
+			return strings.ToLower(cleaned)
+		}
+	}
+	return ""
+}
+
+func jsonWorker(jobs <-chan uint32, results chan<- []byte, wg *sync.WaitGroup, cfg *Config) {
 	defer wg.Done()
 	for ip := range jobs {
-		timestamp := time.Now()
-		var response DNSResponse
-		var err error
-		var server string
+		response, server, err := resolve(ip, cfg)
 
-		if len(cfg.dnsServers) > 0 {
-			response, server, err = lookupWithRetry(ip, cfg)
-			if idx := strings.Index(server, ":"); idx != -1 {
-				server = server[:idx]
+		if err != nil {
+			if cfg.debug {
+				if data, err := marshalRecord(time.Now(), formatIP(ip), server, formatErrorAsHostname(err), "ERR", "", 0); err == nil {
+					results <- data
+				}
 			}
-		} else {
-			names, err := net.LookupAddr(ip)
-			if err == nil {
-				response = DNSResponse{Names: names, RecordType: "PTR"}
+			continue
+		}
+
+		if len(response.Names) == 0 {
+			if cfg.debug {
+				if data, err := marshalRecord(time.Now(), formatIP(ip), server, noPTRRecord, "ERR", "", 0); err == nil {
+					results <- data
+				}
 			}
+			continue
 		}
 
+		ptr := firstPTR(response.Names)
+		if ptr == "" {
+			continue
+		}
+
+		if data, err := marshalRecord(time.Now(), formatIP(ip), server, ptr, response.RecordType, response.Target, response.TTL); err == nil {
+			results <- data
+		}
+	}
+}
+
+func worker(jobs <-chan uint32, wg *sync.WaitGroup, cfg *Config, stats *Stats, lines *LineBuffer) {
+	defer wg.Done()
+	for ip := range jobs {
+		timestamp := time.Now()
+		response, server, err := resolve(ip, cfg)
+
 		stats.increment()
 
 		if err != nil {
 			stats.incrementFailed()
 			if cfg.debug {
+				ipStr := formatIP(ip)
 				errRecord := formatErrorAsHostname(err)
-				timeStr := time.Now().Format("2006-01-02 15:04:05")
-				line := fmt.Sprintf("[gray]%s [gray]│[-] [purple]%15s[-] [gray]│[-] [aqua]%-15s[-] [gray]│[-] [red] ERR [-] [gray]│[-] [gray]%-6s[-] [gray]│[-] [gray]%s[-]\n",
-					timeStr,
-					ip,
+				line := fmt.Sprintf(errorLineFormat,
+					time.Now().Format(timeFormat),
+					ipStr,
 					server,
-					"",
-					errRecord)
-				app.QueueUpdateDraw(func() {
-					fmt.Fprint(textView, line)
-					textView.ScrollToEnd()
-				})
+					"[gray]"+errRecord+"[-]")
+				lines.add(line)
 
 				// Write to NDJSON if enabled
-				writeNDJSON(cfg, time.Now(), ip, server, errRecord, "ERR", "", 0)
+				writeNDJSON(cfg, time.Now(), ipStr, server, errRecord, "ERR", "", 0)
 			}
 			continue
 		}
@@ -382,73 +1050,56 @@ func worker(jobs <-chan string, wg *sync.WaitGroup, cfg *Config, stats *Stats, t
 		if len(response.Names) == 0 {
 			stats.incrementFailed()
 			if cfg.debug {
-				timeStr := time.Now().Format("2006-01-02 15:04:05")
-				line := fmt.Sprintf("[gray]%s [gray]│[-] [purple]%15s[-] [gray]│[-] [aqua]%-15s[-] [gray]│[-] [red] ERR [-] [gray]│[-] [gray]%-6s[-] [gray]│[-] [red]No PTR record[-]\n",
-					timeStr,
-					ip,
+				ipStr := formatIP(ip)
+				line := fmt.Sprintf(errorLineFormat,
+					time.Now().Format(timeFormat),
+					ipStr,
 					server,
-					"")
-				app.QueueUpdateDraw(func() {
-					fmt.Fprint(textView, line)
-					textView.ScrollToEnd()
-				})
+					"[red]No PTR record[-]")
+				lines.add(line)
+
+				writeNDJSON(cfg, time.Now(), ipStr, server, noPTRRecord, "ERR", "", 0)
 			}
 			continue
 		}
 
 		stats.incrementSuccess()
 
-		ptr := ""
-		for _, name := range response.Names {
-			if cleaned := strings.TrimSpace(strings.TrimSuffix(name, ".")); cleaned != "" {
-				ptr = strings.ToLower(cleaned)
-				break
-			}
-		}
-
+		ptr := firstPTR(response.Names)
 		if ptr == "" {
 			continue
 		}
 
-		writeNDJSON(cfg, timestamp, ip, server, ptr, response.RecordType, response.Target, response.TTL)
+		ipStr := formatIP(ip)
+		writeNDJSON(cfg, timestamp, ipStr, server, ptr, response.RecordType, response.Target, response.TTL)
 
-		timeStr := time.Now().Format("2006-01-02 15:04:05")
-		recordTypeColor := "[blue] PTR [-]"
+		timeStr := time.Now().Format(timeFormat)
+		recordTypeColor := ptrTag
 		if response.RecordType == "CNAME" {
 			stats.incrementCNAME()
-			recordTypeColor = "[fuchsia]CNAME[-]"
-			ptr = fmt.Sprintf("%s -> %s", strings.ToLower(ptr), strings.ToLower(response.Target))
+			recordTypeColor = cnameTag
+			ptr = ptr + " -> " + strings.ToLower(response.Target)
 		}
 
 		var line string
 		if len(cfg.dnsServers) > 0 {
-			line = fmt.Sprintf("[gray]%s [gray]│[-] [purple]%15s[-] [gray]│[-] [aqua]%-15s[-] [gray]│[-] %-5s [gray]│[-] %s [gray]│[-] %s\n",
+			line = fmt.Sprintf(resultLineFormat,
 				timeStr,
-				ip,
+				ipStr,
 				server,
 				recordTypeColor,
 				colorizeTTL(response.TTL),
-				colorizeIPInPtr(ptr, ip))
+				colorizeIPInPtr(ptr, ipStr))
 		} else {
-			line = fmt.Sprintf("[gray]%s [gray]│[-] [purple]%15s[-] [gray]│[-] %-5s [gray]│[-] %s [gray]│[-] %s\n",
+			line = fmt.Sprintf(resultLineNoServerFormat,
 				timeStr,
-				ip,
+				ipStr,
 				recordTypeColor,
 				colorizeTTL(response.TTL),
-				colorizeIPInPtr(ptr, ip))
+				colorizeIPInPtr(ptr, ipStr))
 		}
 
-		app.QueueUpdateDraw(func() {
-			fmt.Fprint(textView, line)
-			content := textView.GetText(false)
-			lines := strings.Split(content, "\n")
-			if len(lines) > maxBufferLines {
-				newContent := strings.Join(lines[len(lines)-maxBufferLines:], "\n")
-				textView.Clear()
-				fmt.Fprint(textView, newContent)
-			}
-			textView.ScrollToEnd()
-		})
+		lines.add(line)
 	}
 }
 
@@ -502,9 +1153,14 @@ func (c *Config) updateDNSServers() error {
 		}
 	}
 
+	pool := newResolvers(resolvers)
+	if len(pool) == 0 {
+		return fmt.Errorf("no valid resolvers found in update")
+	}
+
 	c.mu.Lock()
 	c.dnsServers = resolvers
-	c.serverIndex = 0
+	c.resolvers = pool
 	c.lastDNSUpdate = time.Now()
 	c.mu.Unlock()
 
@@ -522,8 +1178,30 @@ func main() {
 	shard := flag.String("shard", "", "Shard specification (e.g., 1/4 for first shard of 4)")
 	loop := flag.Bool("l", false, "Loop continuously after completion")
 	jsonOutput := flag.Bool("j", false, "Output NDJSON to stdout (no TUI)")
+	cpuProfile := flag.String("cpuprofile", "", "Write a CPU profile to this file (for PGO builds)")
 	flag.Parse()
 
+	if *cpuProfile != "" {
+		f, err := os.Create(*cpuProfile)
+		if err != nil {
+			fmt.Printf("Error creating CPU profile: %v\n", err)
+			return
+		}
+		defer f.Close()
+
+		if err := pprof.StartCPUProfile(f); err != nil {
+			fmt.Printf("Error starting CPU profile: %v\n", err)
+			return
+		}
+		defer pprof.StopCPUProfile()
+	}
+
+	// Each worker has at most one query in flight and DNS IDs are 16 bits
+	if *concurrency < 1 || *concurrency >= 1<<16 {
+		fmt.Println("Concurrency must be between 1 and 65535")
+		return
+	}
+
 	shardNum, totalShards, err := parseShardArg(*shard)
 	if err != nil {
 		fmt.Printf("Error parsing shard argument: %v\n", err)
@@ -552,18 +1230,30 @@ func main() {
 		retries:       *retries,
 		debug:         *debug,
 		dnsServers:    servers,
+		resolvers:     newResolvers(servers),
 		lastDNSUpdate: time.Now(),
 		loop:          *loop,
 	}
 
+	if len(cfg.resolvers) == 0 {
+		fmt.Println("Error loading DNS servers: no usable entries found")
+		return
+	}
+
+	cfg.transport, err = newTransport()
+	if err != nil {
+		fmt.Printf("Error creating DNS transport: %v\n", err)
+		return
+	}
+
 	if *outputPath != "" {
 		f, err := os.OpenFile(*outputPath, os.O_CREATE|os.O_WRONLY|os.O_APPEND, 0644)
 		if err != nil {
 			fmt.Printf("Error opening output file: %v\n", err)
 			return
 		}
-		cfg.outputFile = f
-		defer f.Close()
+		cfg.startWriter(f)
+		defer cfg.stopWriter()
 	}
 
 	app := tview.NewApplication()
@@ -571,9 +1261,7 @@ func main() {
 	textView := tview.NewTextView().
 		SetDynamicColors(true).
 		SetScrollable(true).
-		SetChangedFunc(func() {
-			app.Draw()
-		})
+		SetMaxLines(maxBufferLines)
 	textView.SetBorder(true).SetTitle(" PTR Records ")
 
 	progress := tview.NewTextView().
@@ -587,7 +1275,7 @@ func main() {
 		AddItem(progress, 4, 0, false)
 
 	stats := &Stats{
-		total:         1 << 32,
+		total:         publicAddressCount(),
 		lastCheckTime: time.Now(),
 		startTime:     time.Now(),
 	}
@@ -673,167 +1361,81 @@ func main() {
 		}
 	}()
 
+	// On the first SIGINT/SIGTERM stop feeding new work and let main return
+	// normally so buffered output is flushed and files are closed; a second
+	// signal exits immediately.
+	quit := make(chan struct{})
+	go func() {
+		sigs := make(chan os.Signal, 2)
+		signal.Notify(sigs, os.Interrupt, syscall.SIGTERM)
+		<-sigs
+		close(quit)
+		<-sigs
+		os.Exit(1)
+	}()
+
 	if *jsonOutput {
 		// JSON-only mode
-		jobs := make(chan string, cfg.concurrency)
+		jobs := make(chan uint32, cfg.concurrency*2)
+		results := make(chan []byte, cfg.concurrency*2)
+		done := make(chan struct{})
 		var wg sync.WaitGroup
 
-		// Start workers
-		for i := 0; i < cfg.concurrency; i++ {
-			wg.Add(1)
-			go func() {
-				defer wg.Done()
-				for ip := range jobs {
-					var response DNSResponse
-					var err error
-					var server string
-
-					if len(cfg.dnsServers) > 0 {
-						response, server, err = lookupWithRetry(ip, cfg)
-						if idx := strings.Index(server, ":"); idx != -1 {
-							server = server[:idx]
-						}
-					} else {
-						names, err := net.LookupAddr(ip)
-						if err == nil {
-							response = DNSResponse{Names: names, RecordType: "PTR"}
-						}
-					}
-
-					if err != nil {
-						if cfg.debug {
-							errRecord := formatErrorAsHostname(err)
-							record := struct {
-								Seen       string `json:"seen"`
-								IP         string `json:"ip"`
-								Nameserver string `json:"nameserver"`
-								Record     string `json:"record"`
-								RecordType string `json:"record_type"`
-								TTL        uint32 `json:"ttl"`
-							}{
-								Seen:       time.Now().Format(time.RFC3339),
-								IP:         ip,
-								Nameserver: server,
-								Record:     errRecord,
-								RecordType: "ERR",
-								TTL:        0,
-							}
-							if data, err := json.Marshal(record); err == nil {
-								fmt.Println(string(data))
-							}
-						}
-						continue
-					}
-
-					if len(response.Names) == 0 {
-						if cfg.debug {
-							record := struct {
-								Seen       string `json:"seen"`
-								IP         string `json:"ip"`
-								Nameserver string `json:"nameserver"`
-								Record     string `json:"record"`
-								RecordType string `json:"record_type"`
-								TTL        uint32 `json:"ttl"`
-							}{
-								Seen:       time.Now().Format(time.RFC3339),
-								IP:         ip,
-								Nameserver: server,
-								Record:     "FAIL.NO-PTR-RECORD.in-addr.arpa",
-								RecordType: "ERR",
-								TTL:        0,
-							}
-							if data, err := json.Marshal(record); err == nil {
-								fmt.Println(string(data))
-							}
-						}
-						continue
-					}
+		// A single consumer owns stdout so workers never contend on it
+		go func() {
+			defer close(done)
 
-					ptr := ""
-					for _, name := range response.Names {
-						if cleaned := strings.TrimSpace(strings.TrimSuffix(name, ".")); cleaned != "" {
-							ptr = cleaned
-							break
-						}
-					}
+			w := bufio.NewWriterSize(os.Stdout, outputBufferSize)
+			ticker := time.NewTicker(displayFlushInterval)
+			defer ticker.Stop()
 
-					if ptr == "" {
-						continue
-					}
-
-					record := struct {
-						Seen       string `json:"seen"`
-						IP         string `json:"ip"`
-						Nameserver string `json:"nameserver"`
-						Record     string `json:"record"`
-						RecordType string `json:"record_type"`
-						TTL        uint32 `json:"ttl"`
-					}{
-						Seen:       time.Now().Format(time.RFC3339),
-						IP:         ip,
-						Nameserver: server,
-						Record:     response.Target,
-						RecordType: response.RecordType,
-						TTL:        response.TTL,
-					}
-
-					if response.RecordType != "CNAME" {
-						record.Record = ptr
-					}
-
-					if data, err := json.Marshal(record); err == nil {
-						fmt.Println(string(data))
+			for {
+				select {
+				case line, ok := <-results:
+					if !ok {
+						w.Flush()
+						return
 					}
+					w.Write(line)
+				case <-ticker.C:
+					w.Flush()
 				}
-			}()
-		}
-
-		// Feed IPs to workers
-		for {
-			stream, err := golcg.IPStream("0.0.0.0/0", shardNum, totalShards, int(*seed), nil)
-			if err != nil {
-				fmt.Fprintf(os.Stderr, "Error creating IP stream: %v\n", err)
-				return
-			}
-
-			for ip := range stream {
-				jobs <- ip
 			}
+		}()
 
-			if !cfg.loop {
-				break
-			}
+		// Start workers
+		for i := 0; i < cfg.concurrency; i++ {
+			wg.Add(1)
+			go jsonWorker(jobs, results, &wg, cfg)
 		}
-		close(jobs)
+
+		// Feed IPs to workers
+		feedIPs(jobs, quit, *seed, shardNum, totalShards, cfg.loop)
 		wg.Wait()
+		close(results)
+		<-done
 		return
 	}
 
-	jobs := make(chan string, cfg.concurrency)
-
+	lines := &LineBuffer{}
 	go func() {
-		for {
-			stream, err := golcg.IPStream("0.0.0.0/0", shardNum, totalShards, int(*seed), nil)
-			if err != nil {
-				fmt.Printf("Error creating IP stream: %v\n", err)
-				return
-			}
-
-			for ip := range stream {
-				jobs <- ip
-			}
-
-			if !cfg.loop {
-				break
+		for range time.Tick(displayFlushInterval) {
+			if data := lines.take(); data != nil {
+				app.QueueUpdateDraw(func() {
+					textView.Write(data)
+					textView.ScrollToEnd()
+				})
 			}
 		}
-		close(jobs)
 	}()
 
+	jobs := make(chan uint32, cfg.concurrency*2)
+	go feedIPs(jobs, quit, *seed, shardNum, totalShards, cfg.loop)
+
 	var wg sync.WaitGroup
 	for i := 0; i < cfg.concurrency; i++ {
 		wg.Add(1)
-		go worker(jobs, &wg, cfg, stats, textView, app)
+		go worker(jobs, &wg, cfg, stats, lines)
 	}
 
 	go func() {
@@ -841,6 +1443,11 @@ func main() {
 		app.Stop()
 	}()
 
+	go func() {
+		<-quit
+		app.Stop()
+	}()
+
 	if err := app.SetRoot(flex, true).EnableMouse(true).Run(); err != nil {
 		panic(err)
 	}
@@ -879,37 +1486,45 @@ func visibleLength(s string) int {
 	return len(noColors)
 }
 
-func writeNDJSON(cfg *Config, timestamp time.Time, ip, server, ptr, recordType, target string, ttl uint32) {
-	if cfg.outputFile == nil {
-		return
-	}
+type Record struct {
+	Seen       string `json:"seen"`
+	IP         string `json:"ip"`
+	Nameserver string `json:"nameserver"`
+	Record     string `json:"record"`
+	RecordType string `json:"record_type"`
+	TTL        uint32 `json:"ttl"`
+}
 
-	record := struct {
-		Seen       string `json:"seen"`
-		IP         string `json:"ip"`
-		Nameserver string `json:"nameserver"`
-		Record     string `json:"record"`
-		RecordType string `json:"record_type"`
-		TTL        uint32 `json:"ttl"`
-	}{
+// marshalRecord encodes one newline-terminated NDJSON record. CNAME answers
+// record their target, everything else records ptr.
+func marshalRecord(timestamp time.Time, ip, server, ptr, recordType, target string, ttl uint32) ([]byte, error) {
+	record := Record{
 		Seen:       timestamp.Format(time.RFC3339),
 		IP:         ip,
 		Nameserver: server,
-		Record:     target, // For CNAME records, use the target
+		Record:     ptr,
 		RecordType: recordType,
 		TTL:        ttl,
 	}
 
-	// If it's not a CNAME, use the PTR record
-	if recordType != "CNAME" {
-		record.Record = ptr
+	if recordType == "CNAME" {
+		record.Record = target
+	}
+
+	data, err := json.Marshal(record)
+	if err != nil {
+		return nil, err
+	}
+	return append(data, '\n'), nil
+}
+
+func writeNDJSON(cfg *Config, timestamp time.Time, ip, server, ptr, recordType, target string, ttl uint32) {
+	if cfg.output == nil {
+		return
 	}
 
-	if data, err := json.Marshal(record); err == nil {
-		cfg.mu.Lock()
-		cfg.outputFile.Write(data)
-		cfg.outputFile.Write([]byte("\n"))
-		cfg.mu.Unlock()
+	if data, err := marshalRecord(timestamp, ip, server, ptr, recordType, target, ttl); err == nil {
+		cfg.output <- data
 	}
 }
 
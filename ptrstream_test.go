@@ -0,0 +1,334 @@
+package main
+
+import (
+	"bytes"
+	"errors"
+	"net"
+	"net/netip"
+	"testing"
+	"time"
+
+	"github.com/miekg/dns"
+)
+
+func ipv4(t *testing.T, s string) uint32 {
+	t.Helper()
+	a := netip.MustParseAddr(s).As4()
+	return uint32(a[0])<<24 | uint32(a[1])<<16 | uint32(a[2])<<8 | uint32(a[3])
+}
+
+func TestAppendQueryMatchesPack(t *testing.T) {
+	for _, s := range []string{"0.0.0.0", "1.2.3.4", "8.8.8.8", "93.184.216.34", "255.255.255.255"} {
+		arpa, err := dns.ReverseAddr(s)
+		if err != nil {
+			t.Fatalf("ReverseAddr(%s): %v", s, err)
+		}
+
+		m := new(dns.Msg)
+		m.Id = 0xbeef
+		m.RecursionDesired = true
+		m.Question = []dns.Question{{Name: arpa, Qtype: dns.TypePTR, Qclass: dns.ClassINET}}
+		want, err := m.Pack()
+		if err != nil {
+			t.Fatalf("Pack(%s): %v", s, err)
+		}
+
+		if got := appendQuery(nil, 0xbeef, ipv4(t, s)); !bytes.Equal(got, want) {
+			t.Errorf("appendQuery(%s) = % x, want % x", s, got, want)
+		}
+	}
+}
+
+func TestIsReserved(t *testing.T) {
+	tests := []struct {
+		ip       string
+		reserved bool
+	}{
+		{"0.0.0.0", true},
+		{"0.255.255.255", true},
+		{"1.0.0.0", false},
+		{"9.255.255.255", false},
+		{"10.0.0.0", true},
+		{"10.255.255.255", true},
+		{"11.0.0.0", false},
+		{"100.63.255.255", false},
+		{"100.64.0.0", true},
+		{"100.127.255.255", true},
+		{"100.128.0.0", false},
+		{"127.0.0.1", true},
+		{"169.253.255.255", false},
+		{"169.254.0.0", true},
+		{"169.255.0.0", false},
+		{"172.15.255.255", false},
+		{"172.16.0.0", true},
+		{"172.31.255.255", true},
+		{"172.32.0.0", false},
+		{"192.0.0.255", true},
+		{"192.0.1.0", false},
+		{"192.0.2.0", true},
+		{"192.0.3.0", false},
+		{"192.167.255.255", false},
+		{"192.168.0.0", true},
+		{"192.169.0.0", false},
+		{"198.17.255.255", false},
+		{"198.18.0.0", true},
+		{"198.19.255.255", true},
+		{"198.20.0.0", false},
+		{"198.51.100.7", true},
+		{"203.0.113.255", true},
+		{"203.0.114.0", false},
+		{"223.255.255.255", false},
+		{"224.0.0.0", true},
+		{"239.255.255.255", true},
+		{"240.0.0.0", true},
+		{"255.255.255.255", true},
+	}
+
+	for _, tt := range tests {
+		if got := isReserved(ipv4(t, tt.ip)); got != tt.reserved {
+			t.Errorf("isReserved(%s) = %v, want %v", tt.ip, got, tt.reserved)
+		}
+	}
+}
+
+func TestPublicAddressCount(t *testing.T) {
+	if got, want := publicAddressCount(), uint64(3702258688); got != want {
+		t.Errorf("publicAddressCount() = %d, want %d", got, want)
+	}
+}
+
+func TestLCGSkip(t *testing.T) {
+	x := uint32(12345)
+	for n := uint64(0); n < 5000; n++ {
+		if got := lcgSkip(12345, n); got != x {
+			t.Fatalf("lcgSkip(12345, %d) = %d, want %d", n, got, x)
+		}
+		x = x*lcgMultiplier + lcgIncrement
+	}
+}
+
+func TestShardsAreDisjoint(t *testing.T) {
+	const seed, totalShards = 42, 1 << 16
+
+	if g := newIPGenerator(seed, totalShards, totalShards); g.end != 1<<32 {
+		t.Fatalf("last shard ends at %d, want %d", g.end, uint64(1<<32))
+	}
+
+	seen := make(map[uint32]int)
+	for shard := 1; shard <= 4; shard++ {
+		g := newIPGenerator(seed, shard, totalShards)
+		for ip, ok := g.next(); ok; ip, ok = g.next() {
+			if prev, dup := seen[ip]; dup {
+				t.Fatalf("%s produced by shards %d and %d", formatIP(ip), prev, shard)
+			}
+			seen[ip] = shard
+		}
+
+		// Each shard must finish exactly where the next one starts
+		if next := newIPGenerator(seed, shard+1, totalShards); g.state != next.state || g.index != next.index {
+			t.Errorf("shard %d ends at index %d, shard %d starts at %d", shard, g.index, shard+1, next.index)
+		}
+	}
+}
+
+func TestShardLowBitsAreSpread(t *testing.T) {
+	g := newIPGenerator(42, 1, 256)
+	lastOctets := make(map[uint32]bool)
+	for i := 0; i < 10000; i++ {
+		ip, ok := g.next()
+		if !ok {
+			t.Fatal("shard ended early")
+		}
+		lastOctets[ip&0xff] = true
+	}
+	if len(lastOctets) != 256 {
+		t.Errorf("shard 1/256 covered %d distinct last octets, want 256", len(lastOctets))
+	}
+}
+
+// Expected output matches the previous regexp-based implementation,
+// including overlapping and same-offset matches.
+func TestColorizeIPInPtr(t *testing.T) {
+	tests := []struct {
+		ptr, ip, want string
+	}{
+		{"1-2-3-4.example.com", "1.2.3.4", "[aqua]1-2-3-4[white].example.com"},
+		{"4.3.2.1.in-addr.arpa", "1.2.3.4", "[aqua]4.3.2.1[white].[blue]in-addr.arpa"},
+		{"host001-002-003-004.foo.gov", "1.2.3.4", "[white]host[aqua]001-002-003-004[white].foo.[red]gov"},
+		{"x.mil", "9.9.9.9", "[white]x.mil"},
+		{"LocalHost", "1.1.1.1", "[gray]LocalHost"},
+		{"12-1-1-1x1.1.1.12", "12.1.1.1", "[aqua]12-1-1-1[white]x[aqua]1.1.1.12"},
+		{"a1-1-1-1-1-1-1-1b", "1.1.1.1", "[white]a[aqua]1-1-1-1[white]-[aqua]1-1-1-1[white]b"},
+		{"nothing.net", "8.8.8.8", "[white]nothing.net"},
+	}
+
+	for _, tt := range tests {
+		if got := colorizeIPInPtr(tt.ptr, tt.ip); got != tt.want {
+			t.Errorf("colorizeIPInPtr(%q, %q) = %q, want %q", tt.ptr, tt.ip, got, tt.want)
+		}
+	}
+}
+
+func TestBenchedResolverComesBack(t *testing.T) {
+	r := &Resolver{name: "192.0.2.1:53", addr: netip.MustParseAddrPort("192.0.2.1:53")}
+	cfg := &Config{timeout: time.Second, resolvers: []*Resolver{r}}
+
+	for i := 0; i < maxResolverFailures; i++ {
+		cfg.recordFailure(r)
+	}
+	if r.available(time.Now()) {
+		t.Fatal("resolver still available after repeated failures")
+	}
+
+	if !r.available(time.Now().Add(resolverCooldown)) {
+		t.Fatal("resolver not re-admitted after its cooldown")
+	}
+	if r.fails != 0 || r.rtt != 0 {
+		t.Errorf("re-admitted resolver has fails=%d rtt=%d, want a clean score", r.fails, r.rtt)
+	}
+	if !r.available(time.Now()) {
+		t.Error("re-admitted resolver benched again without failing")
+	}
+}
+
+func TestNewResolversResolvesHostnames(t *testing.T) {
+	pool := newResolvers([]string{"127.0.0.1:53", "localhost:53", "not a server"})
+	if len(pool) != 2 {
+		t.Fatalf("newResolvers kept %d entries, want 2", len(pool))
+	}
+	if got := pool[1].addr; !got.Addr().IsLoopback() || got.Port() != 53 {
+		t.Errorf("localhost:53 resolved to %s, want a loopback address on port 53", got)
+	}
+}
+
+// startResponder answers every query sent to a loopback socket with
+// respond(query), sending nothing when it returns nil.
+func startResponder(t *testing.T, respond func(query []byte) []byte) netip.AddrPort {
+	t.Helper()
+	conn, err := net.ListenUDP("udp4", &net.UDPAddr{IP: net.IPv4(127, 0, 0, 1)})
+	if err != nil {
+		t.Fatalf("ListenUDP: %v", err)
+	}
+	t.Cleanup(func() { conn.Close() })
+
+	go func() {
+		buf := make([]byte, 512)
+		for {
+			n, from, err := conn.ReadFromUDPAddrPort(buf)
+			if err != nil {
+				return
+			}
+			if reply := respond(append([]byte(nil), buf[:n]...)); reply != nil {
+				conn.WriteToUDPAddrPort(reply, from)
+			}
+		}
+	}()
+	return conn.LocalAddr().(*net.UDPAddr).AddrPort()
+}
+
+// replyTo turns query into a response with the given header flags, rcode and
+// answer count, without an actual answer section.
+func replyTo(query []byte, flags byte, rcode int, answers uint16) []byte {
+	query[2] |= 0x80 | flags
+	query[3] = byte(rcode)
+	query[6], query[7] = byte(answers>>8), byte(answers)
+	return query
+}
+
+func newTestTransport(t *testing.T) *Transport {
+	t.Helper()
+	tr, err := newTransport()
+	if err != nil {
+		t.Fatal(err)
+	}
+	t.Cleanup(func() { tr.conn.Close() })
+	return tr
+}
+
+func TestExchangeIgnoresMismatchedQuestion(t *testing.T) {
+	server := startResponder(t, func(query []byte) []byte {
+		id := uint16(query[0])<<8 | uint16(query[1])
+		return replyTo(appendQuery(nil, id, ipv4(t, "5.6.7.8")), 0, dns.RcodeSuccess, 1)
+	})
+
+	_, err := newTestTransport(t).exchange(ipv4(t, "1.2.3.4"), server, 200*time.Millisecond)
+	if !errors.Is(err, errQueryTimeout) {
+		t.Errorf("exchange = %v, want %v", err, errQueryTimeout)
+	}
+}
+
+func TestExchangeIgnoresOtherSource(t *testing.T) {
+	other, err := net.ListenUDP("udp4", &net.UDPAddr{IP: net.IPv4(127, 0, 0, 1)})
+	if err != nil {
+		t.Fatalf("ListenUDP: %v", err)
+	}
+	defer other.Close()
+
+	var tr *Transport
+	server := startResponder(t, func(query []byte) []byte {
+		local := tr.conn.LocalAddr().(*net.UDPAddr)
+		other.WriteToUDPAddrPort(replyTo(query, 0, dns.RcodeSuccess, 1), netip.AddrPortFrom(netip.MustParseAddr("127.0.0.1"), uint16(local.Port)))
+		return nil
+	})
+	tr = newTestTransport(t)
+
+	if _, err := tr.exchange(ipv4(t, "1.2.3.4"), server, 200*time.Millisecond); !errors.Is(err, errQueryTimeout) {
+		t.Errorf("exchange = %v, want %v", err, errQueryTimeout)
+	}
+}
+
+func TestExchangeAcceptsUppercaseQuestion(t *testing.T) {
+	server := startResponder(t, func(query []byte) []byte {
+		copy(query[12:], bytes.ToUpper(query[12:]))
+		return replyTo(query, 0, dns.RcodeSuccess, 1)
+	})
+
+	r, err := newTestTransport(t).exchange(ipv4(t, "1.2.3.4"), server, time.Second)
+	if err != nil {
+		t.Fatalf("exchange: %v", err)
+	}
+	if r.rcode != dns.RcodeSuccess || r.data == nil {
+		t.Errorf("exchange = rcode %d, data %v, want a successful reply with data", r.rcode, r.data != nil)
+	}
+}
+
+func TestExchangeNXDomain(t *testing.T) {
+	server := startResponder(t, func(query []byte) []byte {
+		return replyTo(query, 0, dns.RcodeNameError, 0)
+	})
+
+	r, err := newTestTransport(t).exchange(ipv4(t, "1.2.3.4"), server, time.Second)
+	if err != nil {
+		t.Fatalf("exchange: %v", err)
+	}
+	if r.rcode != dns.RcodeNameError || r.data != nil {
+		t.Errorf("exchange = rcode %d, data %v, want rcode %d and no data", r.rcode, r.data != nil, dns.RcodeNameError)
+	}
+}
+
+func TestTruncatedReply(t *testing.T) {
+	server := startResponder(t, func(query []byte) []byte {
+		return replyTo(query, 0x02, dns.RcodeSuccess, 1)
+	})
+	tr := newTestTransport(t)
+
+	r, err := tr.exchange(ipv4(t, "1.2.3.4"), server, time.Second)
+	if err != nil {
+		t.Fatalf("exchange: %v", err)
+	}
+	if !r.truncated || r.data != nil {
+		t.Errorf("exchange = truncated %v, data %v, want truncated with no data", r.truncated, r.data != nil)
+	}
+
+	cfg := &Config{
+		transport:     tr,
+		resolvers:     newResolvers([]string{server.String()}),
+		retries:       2,
+		timeout:       time.Second,
+		lastDNSUpdate: time.Now(),
+	}
+	_, _, err = lookupWithRetry(ipv4(t, "1.2.3.4"), cfg)
+	if got, want := formatErrorAsHostname(err), "FAIL.TRUNCATED.in-addr.arpa"; got != want {
+		t.Errorf("lookupWithRetry error %v formats as %q, want %q", err, got, want)
+	}
+}